@@ -4,90 +4,435 @@
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
+from google.api_core import exceptions
+from google.api_core import retry
+from google.cloud.firestore_v1.client import Client
+from google.cloud.firestore_v1.field_path import FieldPath
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext, suppress
 from datetime import datetime
+from itertools import islice, repeat
+from operator import itemgetter
 import csv
+import gzip
+import io
+import logging
 import os
+import queue
 import shutil
+import threading
+
+logger = logging.getLogger(__name__)
+
+_SHARD_ID_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'  # Chars of auto-generated doc ids, in __name__ order
+_MISSING = object()          # Sentinel for missing fields, never equal to any field value
+_SKIP_KEY = 'TO_SKIP'        # Field marking rows to skip
+_SKIP_VALUES = (None, 'VALUE_TO_SKIP')   # Values of _SKIP_KEY marking rows to skip (rows missing _SKIP_KEY are kept)
+_MAX_SHARDS = 16             # Cap # of concurrent shard streams so that the client/backend don't just queue them up
+_PAGE_RETRY = retry.Retry(   # Retry a page with exponential backoff on transient errors (like 503), for up to 15 min
+    predicate=retry.if_exception_type(exceptions.ServiceUnavailable, exceptions.DeadlineExceeded, exceptions.InternalServerError, exceptions.TooManyRequests),
+    initial=1.0, maximum=60.0, multiplier=2.0, deadline=900.0)
+
+# %%
+def _to_local(value, doc_id=None):
+    """ Convert timestamp to local time. Blank and string values are returned as is
+    Args:
+        value: field value, like a DatetimeWithNanoseconds
+        doc_id: doc id, only used in exception message
+    """
+    if (value is None) or (type(value) is str):
+        return value
+    try:
+        return value.astimezone()   # No tz argument: local offset is looked up for each date (DST and historical offset changes)
+    except Exception as e_time_conv:
+        logger.warning('??? firestore_to_csv() - Exception in converting timestamp of %s in %s: %s', doc_id, value, e_time_conv)
+        return value
+
+def _fetch_page(query, cursor=None):
+    """ Fetch one page of query results
+    Args:
+        query: Firestore query with limit and order already applied
+        cursor: snapshot of last doc of previous page. Default to None to fetch first page
+    Returns:
+        list of document snapshots in the page
+    """
+    if cursor:      # Stream next page starting from cursor
+        query = query.start_after(cursor)
+
+    # Page is only handed over once fully read, so a failed page is simply fetched again from the same cursor
+    def on_error(e_page):
+        logger.warning('??? firestore_to_csv() - Transient exception in fetching page, retrying from same cursor: %s', e_page)
+    return _PAGE_RETRY(lambda: list(query.stream()), on_error=on_error)()
+
+def _iter_pages(query, page_size, max_docs_to_read=-1):
+    """ Yield pages of query results, fetching the next page in background while the current page is processed
+    Args:
+        query: Firestore query with limit (page_size) and order already applied
+        page_size: max # of docs per page, used to detect the last page
+        max_docs_to_read: max # of documents to read. Next page is only prefetched while fewer docs have been fetched
+    """
+    fetched_count = 0
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_page = executor.submit(_fetch_page, query)
+        while True:
+            docs = next_page.result()
+            fetched_count += len(docs)
+            next_page = None
+            if len(docs) < page_size:       # Last page (not a full page)
+                yield docs
+                return
+
+            # Prefetch next page only if caller is sure to need it, so that no doc is read in vain
+            if (max_docs_to_read < 0) or (fetched_count < max_docs_to_read):
+                next_page = executor.submit(_fetch_page, query, docs[-1])
+            yield docs
+            if next_page is None:
+                next_page = executor.submit(_fetch_page, query, docs[-1])
+
+def _iter_stream_pages(query, page_size, max_docs_to_read=-1):
+    """ Yield batches of one long-running stream over the whole query, instead of issuing one query per page
+    Args:
+        query: Firestore query with order already applied (no limit)
+        page_size: max # of docs per batch to write at a time
+        max_docs_to_read: max # of documents to read. Not needed here, as the stream is cancelled once the caller stops iterating
+    """
+    stream_iter = query.stream(retry=_PAGE_RETRY, timeout=None)    # SDK resumes the stream after last doc read on transient errors
+    try:
+        while True:
+            docs = list(islice(stream_iter, page_size))
+            yield docs
+            if len(docs) < page_size:       # Stream exhausted
+                return
+    finally:
+        stream_iter.close()                 # Cancel stream if caller stopped early (e.g. max limit exceeded)
+
+def _shard_queries(coll_ref, query, shards):
+    """ Split query into shards of contiguous doc id ranges, using auto-generated doc id chars as boundaries
+    Args:
+        coll_ref: Firestore collection reference, used to build boundary doc references
+        query: Firestore query with order by __name__ (and limit if paginated) already applied
+        shards: # of shards to split into
+    Returns:
+        list of queries together covering the whole collection (custom doc ids are covered too, just less evenly)
+    """
+    bounds = [coll_ref.document(_SHARD_ID_CHARS[len(_SHARD_ID_CHARS) * i // shards]) for i in range(1, shards)]
+    queries = []
+    for i in range(shards):
+        shard_query = query
+        if i > 0:               # First shard has no lower bound
+            shard_query = shard_query.start_at({'__name__': bounds[i-1]})
+        if i < shards - 1:      # Last shard has no upper bound
+            shard_query = shard_query.end_before({'__name__': bounds[i]})
+        queries.append(shard_query)
+    return queries
+
+def _iter_pages_sharded(queries, page_size, max_docs_to_read=-1, iter_pages=_iter_pages):
+    """ Yield pages of shard queries streamed concurrently, in order of arrival (not in doc id order)
+    Args:
+        queries: Firestore queries of each shard (see _shard_queries)
+        page_size: max # of docs per page, used to detect the last page of each shard
+        max_docs_to_read: max # of documents to read. Shared by all shards: a shard only fetches another page while fewer docs
+            have been fetched/reserved in total, or when the consumer is waiting with no page left in flight (e.g. rows skipped)
+        iter_pages: function yielding pages of each shard (_iter_pages, or _iter_stream_pages for single stream per shard)
+    """
+    pages = queue.Queue(maxsize=2 * len(queries))   # Bounded so that shards wait if CSV writing falls behind
+    stop = threading.Event()
+    budget = threading.Condition()
+    state = {'reserved': 0, 'in_flight': 0, 'waiting': False}  # Docs fetched or reserved by pages in flight, pages in flight, consumer waiting
+
+    def put(item):      # Block while queue is full, but give up once consumer has stopped
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def reserve():      # Wait until another page may be fetched. Return False once consumer has stopped
+        with budget:
+            while not stop.is_set():
+                if (max_docs_to_read < 0) or (state['reserved'] < max_docs_to_read) or (state['waiting'] and state['in_flight'] == 0):
+                    state['reserved'] += page_size
+                    state['in_flight'] += 1
+                    return True
+                budget.wait(0.1)
+            return False
+
+    def release(fetched):   # Replace page reservation by # of docs actually fetched
+        with budget:
+            state['reserved'] -= page_size - fetched
+            state['in_flight'] -= 1
+            budget.notify_all()
+
+    def produce(shard_query):
+        # Without max limit, let each shard prefetch. With max limit, shard only fetches next page once reserved (0: never prefetch)
+        shard_pages = iter_pages(shard_query, page_size, max_docs_to_read if max_docs_to_read < 0 else 0)
+        try:
+            while reserve():
+                docs = None
+                try:
+                    docs = next(shard_pages, None)
+                finally:
+                    release(len(docs) if docs else 0)
+                if docs is None:
+                    put(None)               # Signal shard finished
+                    return
+                put(docs)
+        except Exception as e_shard:
+            put(e_shard)                    # Hand exception over to consumer
+        finally:
+            shard_pages.close()
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        for shard_query in queries:
+            executor.submit(produce, shard_query)
+        try:
+            running = len(queries)
+            while running:
+                with budget:                # Let a shard fetch past max limit only if consumer still needs pages (rows were skipped)
+                    state['waiting'] = pages.empty()
+                    budget.notify_all()
+                docs = pages.get()
+                with budget:
+                    state['waiting'] = False
+                if docs is None:
+                    running -= 1
+                elif isinstance(docs, Exception):
+                    raise docs
+                else:
+                    yield docs
+        finally:
+            stop.set()                      # Let shards still running exit
+
+def _row_getter(fields):
+    """ Return function picking fields from a dict as a row tuple, in C via itemgetter
+    Args:
+        fields: fields to pick, in header order
+    """
+    if len(fields) == 1:        # itemgetter of a single field returns the value itself, not a tuple
+        field = fields[0]
+        return lambda row_dict: (row_dict[field],)
+    return itemgetter(*fields) if fields else (lambda row_dict: ())
+
+def _page_rows(docs, base_row, get_row, date_fields, add_id, skip_key=_SKIP_KEY, skip_values=_SKIP_VALUES):
+    """ Turn a page of docs into CSV rows in a single call, with everything the per-doc loop needs bound as locals
+    Args:
+        docs: document snapshots of the page
+        base_row: dict of all fields to write set to 'Null', for missing fields
+        get_row: function picking fields to write from a dict in header order (see _row_getter)
+        date_fields: fields to convert to local time
+        add_id: capture doc id in FIRESTORE_ID field
+        skip_key, skip_values: rows with skip_key set to one of skip_values are skipped
+    Returns:
+        list of rows to write
+    """
+    rows = []
+    append = rows.append
+    for doc in docs:
+        doc_dict = doc.to_dict()
+
+        # Skip certain rows before any other processing. Comment out if not used
+        if doc_dict.get(skip_key, _MISSING) in skip_values:
+            continue
+
+        # Fill doc into base row in one dict merge, so that missing fields default to 'Null'
+        row_dict = {**base_row, **doc_dict}
+
+        # Process columns (e.g. add an id column)
+        if add_id:
+            row_dict['FIRESTORE_ID'] = doc.id   # Capture doc id itself if FIRESTORE_ID is in fields_to_read
+
+        # Process rows (e.g. convert all date columns to local time). Comment out if not used
+        for field in date_fields:
+            row_dict[field] = _to_local(row_dict[field], doc.id)
+
+        append(get_row(row_dict))
+    return rows
+
+def _csv_bytes(rows):
+    """ Format rows as CSV in memory and encode them to UTF-8 in one go, instead of per write through a text file
+    Args:
+        rows: rows to format (lists of values)
+    Returns:
+        UTF-8 encoded CSV bytes
+    """
+    buffer = io.StringIO(newline='')
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+@contextmanager
+def _open_csv(csv_filename, buffer_size, sync=True):
+    """ Open CSV file for binary writing, then flush and sync it to disk once when done
+    Args:
+        csv_filename: CSV filename to save. If ending with .gz, file is gzip compressed on the fly (level 1, cheap on CPU)
+        buffer_size: file buffer size
+        sync: fsync file before closing it. Turn off if the caller syncs files later (like chunk files, see _sync_files)
+    """
+    with open(csv_filename, 'wb', buffering=buffer_size) as rawfile:
+        if csv_filename.endswith('.gz'):
+            with gzip.GzipFile(fileobj=rawfile, mode='wb', compresslevel=1) as gzfile:
+                yield gzfile
+        else:
+            yield rawfile
+
+        # Flush buffer and sync file to disk once before closing it
+        if sync:
+            rawfile.flush()
+            os.fsync(rawfile.fileno())
+
+def _chunk_filename(csv_filename, chunk_idx):
+    """ Number CSV filename for one chunk, like extract.csv -> extract_00001.csv (or extract.csv.gz -> extract_00001.csv.gz) """
+    root, ext = os.path.splitext(csv_filename)
+    if ext == '.gz':
+        root, csv_ext = os.path.splitext(root)
+        ext = csv_ext + ext
+    return f'{root}_{chunk_idx:05d}{ext}'
+
+def _write_csv_file(csv_filename, buffer_size, *chunks):
+    """ Write encoded CSV chunks (like header and rows of a page) into a new CSV file, without syncing it (see _sync_files) """
+    with _open_csv(csv_filename, buffer_size, sync=False) as csvfile:
+        for chunk in chunks:
+            csvfile.write(chunk)
+
+def _sync_files(filenames):
+    """ Sync written files to disk in one pass at the end, instead of one fsync per file while writing """
+    for filename in filenames:
+        with open(filename, 'ab') as written_file:  # Append mode so that fsync also works on Windows, without touching content
+            os.fsync(written_file.fileno())
 
 # %%
-def firestore_to_csv_paginated(db, coll_to_read, fields_to_read, csv_filename='extract.csv', max_docs_to_read=-1, write_headers=True):
+def firestore_to_csv_paginated(db, coll_to_read, fields_to_read, csv_filename='extract.csv', max_docs_to_read=-1, write_headers=True, shards=1, page_size=1000, files_per_chunk=False, single_stream=False):
     """ Extract Firestore collection data and save in CSV file
     Args:
         db: Firestore database object
         coll_to_read: name of collection to read from in Unicode format (like u'CollectionName')
         fields_to_read: fields to read (like ['FIELD1', 'FIELD2']). Will be used as CSV headers if write_headers=True
-        csv_filename: CSV filename to save
+        csv_filename: CSV filename to save. Use a .csv.gz filename to gzip compress it on the fly (saves bandwidth on network storage)
         max_docs_to_read: max # of documents to read. Default to -1 to read all
         write_headers: also write headers into CSV file
+        shards: # of doc id ranges to read concurrently (up to 16). Default to 1 to keep rows in doc id order.
+            With max_docs_to_read, shards share the limit, but may read up to about one page per shard more than a single cursor
+        page_size: max # of rows per batch to fetch/write at a time. Larger pages mean fewer queries, but adjust in your case to avoid timeout in default 60s
+        files_per_chunk: write each page into its own CSV file (like extract_00001.csv, each with headers) so that files can be copied/read in parallel
+        single_stream: read collection (or each shard) in one long-running stream cut into page_size batches, instead of one query per page.
+            Saves the per-page query cost, but only use it if long streams don't hit the 503 timeout in your case
+    Returns:
+        list of CSV files written
     """
 
     # Check input parameters
-    if (str(type(db)) != "<class 'google.cloud.firestore_v1.client.Client'>") or (type(coll_to_read) is not str) or not (isinstance(fields_to_read, list) or isinstance(fields_to_read, tuple) or isinstance(fields_to_read, set)):
-        print(f'??? {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} firestore_to_csv() - Unexpected parameters: \n\tdb = {db} \n\tcoll_to_read = {coll_to_read} \n\tfields_to_read = {fields_to_read}')
-        return
+    def is_count(value):    # Positive int, but not bool (which is an int subclass)
+        return isinstance(value, int) and not isinstance(value, bool) and (value >= 1)
+    if not isinstance(db, Client) or not isinstance(coll_to_read, str) or not isinstance(fields_to_read, (list, tuple, set)) or not is_count(page_size) or not is_count(shards):
+        logger.error('??? firestore_to_csv() - Unexpected parameters: \n\tdb = %s \n\tcoll_to_read = %s \n\tfields_to_read = %s \n\tpage_size = %s \n\tshards = %s', db, coll_to_read, fields_to_read, page_size, shards)
+        return []
 
     # Read Firestore collection and write CSV file in a paginated algorithm
-    page_size = 1000   # Preset page size (max # of rows per batch to fetch/write at a time). Adjust in your case to avoid timeout in default 60s
+    buffer_size = 4 * 1024 * 1024   # Preset CSV file buffer size, so that pages reach the OS in few large writes
     total_count = 0
+    csv_files = []
+    fields = tuple(fields_to_read)     # Fix field order once (fields_to_read may be a set)
+    base_row = dict.fromkeys(fields, 'Null')   # Default row, built once instead of filling missing fields per row
+    get_row = _row_getter(fields)
+    date_fields = [field for field in fields if 'DATE' in field]   # Fields to convert to local time, found once instead of per doc
+    add_id = 'FIRESTORE_ID' in fields
     coll_ref = db.collection(coll_to_read)
-    docs = []
-    cursor = None
+    select_fields = [field for field in dict.fromkeys(fields + (_SKIP_KEY,)) if field != 'FIRESTORE_ID']   # Fields actually stored in docs
+    query = coll_ref.select([FieldPath(field).to_api_repr() for field in select_fields]).order_by('__name__')   # Only fetch fields to write, to save network bytes
+    if single_stream:
+        iter_pages = _iter_stream_pages
+    else:
+        iter_pages = _iter_pages
+        query = query.limit(page_size)
+    shards = min(shards, _MAX_SHARDS)
+
     try:
+        if shards > 1:     # Stream shards concurrently on the same client. Rows are written in order of arrival
+            pages = _iter_pages_sharded(_shard_queries(coll_ref, query, shards), page_size, max_docs_to_read, iter_pages)
+        else:
+            pages = iter_pages(query, page_size, max_docs_to_read)
+
         # Open CSV file and write header if required
-        print(f'>>> {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} firestore_to_csv() - Started processing collection {coll_to_read}...')
-        with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fields_to_read, extrasaction='ignore', restval='Null')
-            if write_headers: 
-                writer.writeheader()
-                print(f'<<< {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} firestore_to_csv() - Finished writing CSV headers: {str(fields_to_read)} \n---')
+        logger.info('>>> firestore_to_csv() - Started processing collection %s...', coll_to_read)
+        header = _csv_bytes([fields]) if write_headers else b''
+        with (nullcontext() if files_per_chunk else _open_csv(csv_filename, buffer_size)) as csvfile, ThreadPoolExecutor(max_workers=1) as write_executor:
+            if not files_per_chunk:
+                csv_files.append(csv_filename)
+            if write_headers and not files_per_chunk:   # Chunk files get headers when each of them is written
+                csvfile.write(header)
+                logger.info('<<< firestore_to_csv() - Finished writing CSV headers: %s \n---', fields_to_read)
         
-            # Append each page of data fetched into CSV file
-            while True:
-                docs.clear()    # Clear page
-                count = 0       # Reset page counter
-
-                if cursor:      # Stream next page starting from cursor
-                    docs = [snapshot for snapshot in coll_ref.limit(page_size).order_by('__name__').start_after(cursor).stream()]
-                else:           # Stream first page if cursor not defined yet
-                    docs = [snapshot for snapshot in coll_ref.limit(page_size).order_by('__name__').stream()]
-            
-                print(f'>>> {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} firestore_to_csv() - Started writing CSV row {total_count+1}...')    # +1 as total_count starts at 0
-                for doc in docs:
-                    doc_dict = doc.to_dict()
-                    
-                    # Process columns (e.g. add an id column)
-                    doc_dict['FIRESTORE_ID'] = doc.id   # Capture doc id itself. Comment out if not used
-                    
-                    # Process rows (e.g. convert all date columns to local time). Comment out if not used
-                    for header in doc_dict.keys():
-                        if (header.find('DATE') >= 0) and (doc_dict[header] is not None) and (type(doc_dict[header]) is not str):
-                            try:
-                                doc_dict[header] = doc_dict[header].astimezone()
-                            except Exception as e_time_conv:
-                                print(f'??? {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} firestore_to_csv() - Exception in converting timestamp of {doc.id} in {doc_dict[header]}', e_time_conv)
-
-                    # Write rows but skip certain rows. Comment out "if" and unindent "write" and "count" lines if not used
-                    if ('TO_SKIP' not in doc_dict.keys()) or (('TO_SKIP' in doc_dict.keys()) and (doc_dict['TO_SKIP'] is not None) and (doc_dict['TO_SKIP'] != 'VALUE_TO_SKIP')):
-                        writer.writerow(doc_dict)
-                        count += 1
-
-                # Check if finished writing last page or exceeded max limit
-                total_count += count                # Increment total_count
-                if len(docs) < page_size:           # Break out of while loop after fetching/writing last page (not a full page)
-                    break
-                else:
-                    if (max_docs_to_read >= 0) and (total_count >= max_docs_to_read):
-                        break                       # Break out of while loop after preset max limit exceeded
-                    else:
-                        cursor = docs[page_size-1]  # Move cursor to end of current page
-                        continue                    # Continue to process next page
+            # Append each page of data fetched into CSV file (next page is fetched in background while current page is processed,
+            # and previous page is written to disk in background too, as file writes release the GIL)
+            pending_write = None
+            for docs in pages:
+                # Process whole page at once
+                batch = _page_rows(docs, base_row, get_row, date_fields, add_id)
+                chunk = _csv_bytes(batch)
+
+                # Write page in background, after previous page is written (keeps order, and at most one page waiting in memory)
+                if pending_write:
+                    pending_write.result()          # Re-raise exception in writing previous page if any
+                if not files_per_chunk:
+                    pending_write = write_executor.submit(csvfile.write, chunk)
+                elif batch:                         # Skip empty chunk files (e.g. last page with all rows skipped)
+                    csv_files.append(_chunk_filename(csv_filename, len(csv_files) + 1))
+                    pending_write = write_executor.submit(_write_csv_file, csv_files[-1], buffer_size, header, chunk)
+
+                # Check if exceeded max limit (last page, not a full page, ends the loop by itself)
+                total_count += len(batch)           # Increment total_count
+                logger.info('--- firestore_to_csv() - Processed page of %d docs (%d rows written so far)', len(docs), total_count)   # One log line per page
+                if (max_docs_to_read >= 0) and (total_count >= max_docs_to_read):
+                    break                           # Break out of loop after preset max limit exceeded
+
+            if pending_write:
+                pending_write.result()              # Wait for last page to be written
+            if files_per_chunk:
+                _sync_files(csv_files)              # Sync chunk files once, most of them are already written back by now
 
     except Exception as e_read_write:
-        print(f'??? {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} firestore_to_csv() - Exception in reading Firestore collection / writing CSV file:', e_read_write)
+        logger.error('??? firestore_to_csv() - Exception in reading Firestore collection / writing CSV file: %s', e_read_write)
     else:
-        print(f'<<< {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} firestore_to_csv() - Finished writing CSV file with {total_count} rows of data \n---')
+        logger.info('<<< firestore_to_csv() - Finished writing %d CSV file(s) with %d rows of data \n---', len(csv_files), total_count)
+    return csv_files
 
 # %%
+def _copy_file_range(source, target):
+    """ Copy file content inside the kernel with os.copy_file_range (reflink on btrfs/XFS), then copy metadata like copy2()
+    Args:
+        source: Source path including filename
+        target: Target path including filename
+    Returns:
+        True if copied, False if copy_file_range is not available or not supported between these file systems
+    Raises:
+        shutil.SameFileError: if source and target are the same file (like copy2(), instead of truncating source)
+    """
+    if not hasattr(os, 'copy_file_range'):     # Linux only
+        return False
+    if os.path.exists(target) and os.path.samefile(source, target):
+        raise shutil.SameFileError(f'{source!r} and {target!r} are the same file')
+
+    remaining = -1
+    target_opened = False
+    try:
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            target_opened = True
+            remaining = os.fstat(src.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                if copied == 0:                 # Some file systems report nothing copied instead of failing
+                    break
+                remaining -= copied
+    except OSError:                             # E.g. EXDEV/ENOSYS/EOPNOTSUPP
+        remaining = -1
+    if remaining != 0:
+        if target_opened:                       # Remove partial target rather than leave it for the fallback to overwrite
+            with suppress(OSError):
+                os.remove(target)
+        return False
+    shutil.copystat(source, target)
+    return True
+
 def copy_file(source, destination):
     """ Copy file to destination folder
     Args:
@@ -96,29 +441,33 @@ def copy_file(source, destination):
     """
     # Check input parameters
     if (source is None) or (source == '') or (destination is None) or (destination == ''):
-        print(f'??? {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} copy_file() - Blank path: \n\tSource: {source} \n\tDestination: {destination}')
+        logger.error('??? copy_file() - Blank path: \n\tSource: %s \n\tDestination: %s', source, destination)
         return
 
     try:
-        print(f'>>> {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} copy_file() - Started copying file over... \n\t{source} \n\t{destination}')
+        logger.info('>>> copy_file() - Started copying file over... \n\t%s \n\t%s', source, destination)
         # Make destination folder if not existing
-        if not os.path.exists(destination):
-            os.mkdir(destination)
+        os.makedirs(destination, exist_ok=True)  # Safe when copying multiple files in parallel
 
-        # copy2() preserves file metadata
-        shutil.copy2(source, destination)
-        print(f'<<< {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} copy_file() - Finished copying file \n---')
+        # Try kernel-side copy first, else copy2() (which uses sendfile on Linux). Both preserve file metadata
+        target = os.path.join(destination, os.path.basename(source))
+        if not _copy_file_range(source, target):
+            shutil.copy2(source, target)
+        logger.info('<<< copy_file() - Finished copying file %s \n---', source)
     except Exception as copy_e:
-        print(f'??? {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} copy_file() - Exception:', copy_e)
+        logger.error('??? copy_file() - Exception in copying file %s: %s', source, copy_e)
 
 # %%
+# Log with timestamps (formatted by logging instead of per message)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
 # Connect to Firestore with service account
-print(f'>>> {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} Started connecting to Firestore database...')
+logger.info('>>> Started connecting to Firestore database...')
 firestore_key = r'replace_with_your_firebase_key.json'  # Replace with your Firebase key file
 cred = credentials.Certificate(firestore_key)
 app = firebase_admin.initialize_app(cred)
 db = firestore.client(app=app)
-print(f'<<< {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} Firestore database connected \n---')
+logger.info('<<< Firestore database connected \n---')
 
 # %%
 # Specify Firestore schema and extract file info
@@ -134,11 +483,13 @@ csv_filename = csv_filename[0:-4] + datetime.now().strftime("_%Y-%m-%d_%H-%M-%S.
 
 # %%
 # Extract docs from Firestore
-firestore_to_csv_paginated(db, coll_to_read, csv_headers, csv_filename)
+csv_files = firestore_to_csv_paginated(db, coll_to_read, csv_headers, csv_filename)
+# csv_files = firestore_to_csv_paginated(db, coll_to_read, csv_headers, csv_filename, files_per_chunk=True)  # One CSV file per page
 
-# Copy CSV files to destination
-copy_file(csv_filename, r'./extracted_csv')
-# copy_file(csv_filename, r'C:\directory\subdirectory')
-# copy_file(csv_filename, r'//server/path')
+# Copy CSV files to destination (in parallel if multiple files)
+with ThreadPoolExecutor() as executor:
+    list(executor.map(copy_file, csv_files, repeat(r'./extracted_csv')))
+    # list(executor.map(copy_file, csv_files, repeat(r'C:\directory\subdirectory')))
+    # list(executor.map(copy_file, csv_files, repeat(r'//server/path')))
 # %%
 # _ = os.system('pause')    # Uncomment if running in a command window and need to review the messages before exit